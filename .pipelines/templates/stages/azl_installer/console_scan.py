@@ -0,0 +1,28 @@
+from typing import List, Optional
+
+
+class MarkerScanner:
+    """
+    Searches a stream of console chunks for byte markers. Only the newly
+    received data is searched, plus enough of the previous data to catch a
+    marker that was split across several reads.
+    """
+
+    def __init__(self, markers: List[bytes]):
+        self.markers = markers
+        self._overlap = max((len(m) for m in markers), default=1) - 1
+        self._tail = b""
+
+    def feed(self, data: bytes) -> Optional[bytes]:
+        """
+        Search the given chunk and return the first marker, in the order they
+        were given, that has now been seen, or None.
+        """
+        window = self._tail + data
+        for marker in self.markers:
+            if marker in window:
+                return marker
+        # Reads are often shorter than the overlap, so keep the last bytes of
+        # the whole window rather than of the latest chunk.
+        self._tail = window[-self._overlap :] if self._overlap > 0 else b""
+        return None
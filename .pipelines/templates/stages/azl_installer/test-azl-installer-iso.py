@@ -3,36 +3,42 @@
 import argparse
 import libvirt
 import os
-import subprocess
+import time
 import xml.etree.ElementTree as ET
-from typing import Optional
+from typing import Dict, Optional
 
+from console_scan import MarkerScanner
 
-def run_command(command: str) -> str:
-    result = subprocess.run(
-        command, shell=True, capture_output=True, text=True, check=True
-    )
-    return result.stdout
-
+# Maximum number of bytes read from the console stream at once.
+CONSOLE_RECV_SIZE = 64 * 1024
+# Size of the write buffer for the serial log file.
+LOG_BUFFER_SIZE = 64 * 1024
+# Maximum time serial output may sit in the write buffer before being flushed.
+LOG_FLUSH_INTERVAL_SECS = 5
 
-def check_logfile_for_string(output_log_filepath: str, success_string: str) -> bool:
-    with open(output_log_filepath, "r") as file:
-        for line in file:
-            if success_string in line:
-                return True
-    return False
+# libvirt connection and domain handles, opened on first use and then reused.
+_conn: Optional[libvirt.virConnect] = None
+_domains: Dict[str, libvirt.virDomain] = {}
 
 
 def get_domain(vm_name: str) -> libvirt.virDomain:
-    conn = libvirt.open("qemu:///system")
-    domain = conn.lookupByName(vm_name)
+    global _conn
+    if _conn is None:
+        _conn = libvirt.open("qemu:///system")
+    domain = _domains.get(vm_name)
+    if domain is None:
+        domain = _conn.lookupByName(vm_name)
+        _domains[vm_name] = domain
     return domain
 
 
-def get_xml_element_attribute(vm_name: str, xpath: str, attribute: str) -> str:
+def get_domain_xml(vm_name: str) -> ET.Element:
     domain = get_domain(vm_name)
-    tree = ET.fromstring(domain.XMLDesc())
-    xpath_element = tree.find(xpath)
+    return ET.fromstring(domain.XMLDesc())
+
+
+def get_xml_element_attribute(xml_root: ET.Element, xpath: str, attribute: str) -> str:
+    xpath_element = xml_root.find(xpath)
     return xpath_element.attrib[attribute]
 
 
@@ -53,26 +59,37 @@ def watch_for_azl_installer_login(
     vm_name: str,
     success_string: str,
     failure_string: Optional[str],
-    output_log_filepath: str,
     log_file_stream,
 ):
     # Create console connection
     stream = create_console_connection(vm_name)
+    # Search the raw console bytes; the markers are ASCII, so there is no
+    # need to decode every chunk.
+    success_bytes = success_string.encode("utf-8")
+    markers = [success_bytes]
+    if failure_string:
+        markers.append(failure_string.encode("utf-8"))
+    scanner = MarkerScanner(markers)
+    last_flush = time.monotonic()
     # Read from console until 'success_string' is found
     while True:
-        data_bytes = stream.recv(1024)
-        data = data_bytes.decode("utf8", "ignore")
-        log_file_stream.write(data)
-        log_file_stream.flush()
-        if check_logfile_for_string(output_log_filepath, success_string):
+        data_bytes = stream.recv(CONSOLE_RECV_SIZE)
+        log_file_stream.write(data_bytes)
+        # Flush periodically rather than per chunk so the log stays readable
+        # while waiting without paying a write syscall for every read.
+        now = time.monotonic()
+        if now - last_flush >= LOG_FLUSH_INTERVAL_SECS:
+            log_file_stream.flush()
+            last_flush = now
+        found = scanner.feed(data_bytes)
+        if found == success_bytes:
             break
-        if failure_string and check_logfile_for_string(
-            output_log_filepath, failure_string
-        ):
+        if found is not None:
             print(
                 f"Found '{failure_string}' in serial log before reaching login prompt, raising exception"
             )
             raise Exception("installation finished without reaching login prompt")
+    log_file_stream.flush()
     # Close console connection
     stream.finish()
 
@@ -84,14 +101,21 @@ def send_command_to_vm(vm_name, cmd, log_file_stream, output_log_filepath):
     print(f"Sending '{cmd}'")
     ret = stream.send(f"{cmd}\n".encode("utf-8"))
     print(f"... transmitted '{ret}'")
+    scanner = MarkerScanner([cmd.encode("utf-8")])
+    last_flush = time.monotonic()
     # Read from console until 'cmd' is found
     while True:
-        data_bytes = stream.recv(1024)
-        data = data_bytes.decode("utf8", "ignore")
-        log_file_stream.write(data)
-        log_file_stream.flush()
-        if check_logfile_for_string(output_log_filepath, cmd):
+        data_bytes = stream.recv(CONSOLE_RECV_SIZE)
+        log_file_stream.write(data_bytes)
+        # Flush periodically rather than per chunk so the log stays readable
+        # while waiting without paying a write syscall for every read.
+        now = time.monotonic()
+        if now - last_flush >= LOG_FLUSH_INTERVAL_SECS:
+            log_file_stream.flush()
+            last_flush = now
+        if scanner.feed(data_bytes) is not None:
             break
+    log_file_stream.flush()
     print(f"... confirmed transmission, '{cmd}' found in {output_log_filepath}")
     # Close console connection
     stream.finish()
@@ -102,14 +126,15 @@ def validate_azl_installer_iso(vm_name: str, output_log_file: str):
         # Clean log files from any previous run
         os.remove(output_log_file)
 
-    with open(output_log_file, "a") as log_file_stream:
+    with open(output_log_file, "ab", buffering=LOG_BUFFER_SIZE) as log_file_stream:
         # start VM
         print(f"Start VM: {vm_name}")
         start_domain(vm_name)
 
         # get serial pts device
+        domain_xml = get_domain_xml(vm_name)
         serial_pts_device = get_xml_element_attribute(
-            vm_name, "./devices/console[@type='pty']/source", "path"
+            domain_xml, "./devices/console[@type='pty']/source", "path"
         )
         print(f"Find serial port for {vm_name}: {serial_pts_device}")
 
@@ -121,7 +146,6 @@ def validate_azl_installer_iso(vm_name: str, output_log_file: str):
             vm_name,
             "azl-installer login:",
             None,
-            output_log_file,
             log_file_stream,
         )
         print("... azl-installer has booted and started installation script.")
@@ -131,7 +155,6 @@ def validate_azl_installer_iso(vm_name: str, output_log_file: str):
             vm_name,
             "trident-testimg login:",
             "Trident failed",
-            output_log_file,
             log_file_stream,
         )
         print("... finished installing new OS.")
@@ -0,0 +1,44 @@
+from console_scan import MarkerScanner
+
+LOGIN = b"azl-installer login:"
+FAILURE = b"Trident failed"
+
+
+def feed_all(scanner, chunks):
+    for chunk in chunks:
+        found = scanner.feed(chunk)
+        if found is not None:
+            return found
+    return None
+
+
+def test_marker_in_single_chunk():
+    scanner = MarkerScanner([LOGIN, FAILURE])
+    assert feed_all(scanner, [b"boot\nazl-installer login: "]) == LOGIN
+
+
+def test_marker_split_across_short_chunks():
+    scanner = MarkerScanner([LOGIN, FAILURE])
+    chunks = [b"xxxazl-ins", b"taller lo", b"gin: rest"]
+    assert feed_all(scanner, chunks) == LOGIN
+
+
+def test_shorter_marker_split_across_chunks():
+    scanner = MarkerScanner([LOGIN, FAILURE])
+    assert feed_all(scanner, [b"noise Trident fa", b"iled more"]) == FAILURE
+
+
+def test_marker_fed_one_byte_at_a_time():
+    scanner = MarkerScanner([LOGIN, FAILURE])
+    data = b"some output " + FAILURE + b" trailing"
+    assert feed_all(scanner, [data[i : i + 1] for i in range(len(data))]) == FAILURE
+
+
+def test_no_marker():
+    scanner = MarkerScanner([LOGIN, FAILURE])
+    assert feed_all(scanner, [b"azl-installer", b" logi", b"n"]) is None
+
+
+def test_single_byte_marker():
+    scanner = MarkerScanner([b"#"])
+    assert feed_all(scanner, [b"abc", b"d#e"]) == b"#"
@@ -2,11 +2,25 @@
 # Copyright (c) Microsoft Corporation.
 
 import argparse
+import os
+import shutil
+import tempfile
 from typing import Optional
 import yaml
 
 import logging
 
+# Prefer the libyaml-backed implementations when PyYAML was built with them.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+# Block devices assigned to the disks of the Host Configuration, by disk ID.
+DISK_DEVICES = {
+    "os": "/dev/sda",
+    "disk2": "/dev/sdb",
+}
+
 
 def update_trident_host_config(
     *,
@@ -20,7 +34,8 @@ def update_trident_host_config(
     https_proxy: Optional[str] = None,
 ):
     logging.info("Updating Host Configuration section of trident.yaml")
-    os = host_configuration.setdefault("os", {})
+    os_config = host_configuration.setdefault("os", {})
+    storage = host_configuration.get("storage", {})
 
     main_interface = {
         "addresses": [f"{interface_ip}/23"],
@@ -38,7 +53,7 @@ def update_trident_host_config(
         )
 
     # Override network to only preserve the eno interface.
-    os["netplan"] = {
+    os_config["netplan"] = {
         "version": 2,
         "ethernets": {
             interface_name: main_interface,
@@ -49,7 +64,7 @@ def update_trident_host_config(
     wait_online_service = f"systemd-networkd-wait-online@{interface_name}.service"
 
     # Enable systemd-networkd-wait-online service for the interface.
-    enable_services = os.setdefault("services", {}).setdefault("enable", [])
+    enable_services = os_config.setdefault("services", {}).setdefault("enable", [])
     if wait_online_service not in enable_services:
         enable_services.append(wait_online_service)
 
@@ -74,33 +89,38 @@ def update_trident_host_config(
         boot_override += proxy_section
         daemon_override = f'[Service]\nEnvironment="HTTPS_PROXY={escaped_proxy}"\n'
 
-    additional_files = os.setdefault("additionalFiles", [])
-    additional_files.append(
-        {
-            "destination": "/etc/systemd/system/trident.service.d/override.conf",
-            "content": boot_override,
-        }
-    )
-
+    overrides = {
+        "/etc/systemd/system/trident.service.d/override.conf": boot_override,
+    }
     if daemon_override:
-        additional_files.append(
-            {
-                "destination": "/etc/systemd/system/tridentd.service.d/override.conf",
-                "content": daemon_override,
-            }
+        overrides["/etc/systemd/system/tridentd.service.d/override.conf"] = (
+            daemon_override
         )
 
+    # Index the existing files by destination so that running this script
+    # again on an already updated configuration replaces the overrides
+    # instead of appending duplicates.
+    additional_files = os_config.setdefault("additionalFiles", [])
+    file_index_by_destination = {
+        f.get("destination"): i for i, f in enumerate(additional_files)
+    }
+    for destination, content in overrides.items():
+        entry = {"destination": destination, "content": content}
+        index = file_index_by_destination.get(destination)
+        if index is None:
+            additional_files.append(entry)
+        else:
+            additional_files[index] = entry
+
     logging.info("Updating os disks device in trident.yaml")
-    disks = host_configuration.get("storage").get("disks")
-    for disk in disks:
-        if disk["id"] == "os":
-            disk["device"] = "/dev/sda"
-        elif disk["id"] == "disk2":
-            disk["device"] = "/dev/sdb"
+    for disk in storage.get("disks", []):
+        device = DISK_DEVICES.get(disk["id"])
+        if device:
+            disk["device"] = device
 
     # If this is root-verity, we need to set an internal param to be able to
     # configure the network.
-    if is_root_verity(host_configuration):
+    if is_root_verity(storage):
         logging.info(
             "Detected root-verity configuration, setting 'writableEtcOverlayHooks' internal param."
         )
@@ -113,7 +133,6 @@ def update_trident_host_config(
     # PCR 7 into pcrlock policy as SecureBoot is disabled on BM machines.
     # Related ADO task:
     # https://dev.azure.com/mariner-org/polar/_workitems/edit/15566.
-    storage = host_configuration.get("storage")
     if storage and "uki" in test_selection.get("compatible", []):
         encryption = storage.get("encryption")
         if encryption and "pcrs" in encryption:
@@ -122,17 +141,20 @@ def update_trident_host_config(
             )
             encryption["pcrs"] = ["boot-loader-code", "kernel-boot"]
 
-    logging.info(
-        "Final trident_yaml content post all the updates: %s", host_configuration
-    )
+    # Rendering the whole Host Configuration is expensive; only do it when
+    # debug logging is actually enabled.
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(
+            "Final trident_yaml content post all the updates: %s", host_configuration
+        )
 
 
-def is_root_verity(host_configuration: dict) -> bool:
+def is_root_verity(storage: dict) -> bool:
     """
-    Check if the Host Configuration is using root-verity.
+    Check if the storage section of the Host Configuration is using root-verity.
     """
 
-    verity_config = host_configuration.get("storage", {}).get("verity", [])
+    verity_config = storage.get("verity", [])
     if len(verity_config) == 0:
         return False
 
@@ -142,7 +164,7 @@ def is_root_verity(host_configuration: dict) -> bool:
     verity = verity_config[0]
     verity_id = verity.get("id")
 
-    filesystems = host_configuration.get("storage", {}).get("filesystems", [])
+    filesystems = storage.get("filesystems", [])
     verity_filesystem = None
     for fs in filesystems:
         if fs.get("deviceId") == verity_id:
@@ -208,11 +230,11 @@ def main():
     )
     args = parser.parse_args()
 
-    with open(args.trident_yaml) as f:
-        trident_yaml_content = yaml.safe_load(f)
+    with open(args.trident_yaml, "rb") as f:
+        trident_yaml_content = yaml.load(f, Loader=YAML_LOADER)
 
-    with open(args.test_selection) as f:
-        test_selection_content = yaml.safe_load(f)
+    with open(args.test_selection, "rb") as f:
+        test_selection_content = yaml.load(f, Loader=YAML_LOADER)
 
     update_trident_host_config(
         host_configuration=trident_yaml_content,
@@ -226,8 +248,36 @@ def main():
     )
 
     output_path = args.output or args.trident_yaml
-    with open(output_path, "w") as f:
-        yaml.dump(trident_yaml_content, f, default_flow_style=False)
+    # Write next to the output and rename over it, so that an interrupted run
+    # never leaves a truncated trident.yaml behind.
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(output_path)), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            # Keep the original key order and avoid re-wrapping long values
+            # such as URLs; both make the output cheaper to emit and easier to
+            # diff.
+            yaml.dump(
+                trident_yaml_content,
+                f,
+                Dumper=YAML_DUMPER,
+                default_flow_style=False,
+                sort_keys=False,
+                width=4096,
+            )
+        # mkstemp creates the file as 0600; give it the mode the output
+        # already has, or the one open() would have used for a new file.
+        if os.path.exists(output_path):
+            shutil.copymode(output_path, tmp_path)
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp_path, 0o666 & ~umask)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 
 if __name__ == "__main__":
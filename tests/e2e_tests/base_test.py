@@ -1,22 +1,45 @@
-import fabric
+from __future__ import annotations
+
 import json
-import math
 import pytest
 import re
 import yaml
-from enum import Enum
+from itertools import chain
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import fabric
 
 pytestmark = [pytest.mark.base]
 
+# Prefer the libyaml-backed loader when PyYAML was built with it.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+class HostStatusLoader(YAML_LOADER):
+    """
+    Safe YAML loader for the Host Status printed by `trident get`.
+    """
+
 
-# Size units
-class SizeUnit(Enum):
-    B = 1
-    K = math.pow(1024, 1)
-    M = math.pow(1024, 2)
-    G = math.pow(1024, 3)
-    T = math.pow(1024, 4)
-    P = math.pow(1024, 5)
+# Tagged nodes in the Host Status (e.g. `!image`) are read as plain mappings.
+HostStatusLoader.add_multi_constructor(
+    "!", lambda loader, _, node: loader.construct_mapping(node)
+)
+
+
+# Matches one KEY="value" pair of a `blkid` output line.
+BLKID_FIELD_RE = re.compile(r'(\w+)="([^"]*)"')
+
+
+# Size units, in bytes
+SIZE_UNITS = {
+    "K": 1024,
+    "M": 1024**2,
+    "G": 1024**3,
+    "T": 1024**4,
+    "P": 1024**5,
+}
 
 
 def test_connection(connection):
@@ -33,16 +56,16 @@ def test_partitions(connection, hostConfiguration, tridentCommand, abActiveVolum
 
     for disk_elements in hostConfiguration["storage"]["disks"]:
         for partition in disk_elements["partitions"]:
-            # Extract size in bytes
-            size_number = partition["size"][:-1]
-            unit = partition["size"][-1] if partition["size"][-1].isalpha() else "B"
-            size = float(size_number) * SizeUnit[unit].value
-            # Update the expected partitions dictionary
-            expected_partitions[partition["id"]] = partition
-            expected_partitions[partition["id"]]["size"] = size
-
-    # Check partitions type
-    result = connection.run("sudo blkid")
+            # Update the expected partitions dictionary, with the size in bytes
+            expected_partitions[partition["id"]] = {
+                **partition,
+                "size": parse_size(partition["size"]),
+            }
+
+    # Check partitions type and size. Fetch the blkid and lsblk output in a
+    # single round trip, separated by a NUL byte.
+    result = connection.run("sudo blkid && printf '\\0' && lsblk -J -b")
+    blkid_output, lsblk_output = result.stdout.split("\0", 1)
     # Expected output example:
     # /dev/sr0: BLOCK_SIZE="2048" UUID="2023-12-16-00-55-13-99" LABEL="TRIDENT_CDROM" TYPE="iso9660"
     # /dev/sda4: LABEL="3e9cecef-5a01-4" UUID="37a7b4fa-87f0-4887-895b-393f46c345a0" TYPE="swap" PARTLABEL="swap" PARTUUID="3e9cecef-5a01-43d6-a1ae-58bf24f42521"
@@ -53,26 +76,11 @@ def test_partitions(connection, hostConfiguration, tridentCommand, abActiveVolum
     # /dev/sda3: PARTLABEL="root-b" PARTUUID="573fdf4c-9133-4a9f-8cf5-aff7b74d1aeb"
 
     # Structure output
-    partitions_blkid = dict()
-    blkid_info = result.stdout.strip().splitlines()
-
-    for partition in blkid_info:
-        partition_dict = dict()
-        # Extract partition's name (ex: sda1)
-        name_info = partition.split(": ")
-        name = name_info[0].split("/")[-1]
-        # By line structure output into a dictionary with the partition information
-        for info in name_info[1].split():
-            field_value = info.split("=")
-            if len(field_value) == 2:
-                partition_dict[field_value[0]] = field_value[1].replace('"', "")
-        # Adding information to a dictionary for each partition
-        partitions_blkid[name] = partition_dict
+    partitions_blkid = parse_blkid_output(blkid_output)
 
     # Check partitions size
     partitions_system_info = dict()
-    result = connection.run("lsblk -J -b")
-    lsblk_info = json.loads(result.stdout)
+    lsblk_info = json.loads(lsblk_output)
     # Expected output example:
     # {
     #     "blockdevices": [
@@ -138,26 +146,19 @@ def test_partitions(connection, hostConfiguration, tridentCommand, abActiveVolum
     # }
 
     # Gather all partitions from all disks, blockdevices with no children are partitions
-    lsblk_partitions = [
-        partition
+    lsblk_partitions = chain.from_iterable(
+        block_device.get("children") or (block_device,)
         for block_device in lsblk_info["blockdevices"]
-        for partition in (
-            block_device["children"] if "children" in block_device else [block_device]
-        )
-    ]
+    )
 
     # Join lsblk and blkid information to compare with Host Configuration
     for partition in lsblk_partitions:
         # Update information
-        system_name = partition["name"]
-        if not system_name in partitions_blkid:
-            partitions_blkid[system_name] = dict()
-        partitions_blkid[system_name].update(partition)
+        partition_info = partitions_blkid.setdefault(partition["name"], dict())
+        partition_info.update(partition)
         # Add information to partitions_system_info which uses PARTLABEL as key
-        if "PARTLABEL" in partitions_blkid[system_name]:
-            partitions_system_info[partitions_blkid[system_name]["PARTLABEL"]] = (
-                partitions_blkid[system_name]
-            )
+        if "PARTLABEL" in partition_info:
+            partitions_system_info[partition_info["PARTLABEL"]] = partition_info
 
     # Check Host Status
     host_status = get_host_status(connection, tridentCommand)
@@ -276,6 +277,27 @@ def test_partitions(connection, hostConfiguration, tridentCommand, abActiveVolum
             assert host_status["abActiveVolume"] == abActiveVolume
 
 
+def parse_size(size: str) -> int:
+    """
+    Convert a Host Configuration size (e.g. 512M) into bytes.
+    """
+    if size[-1].isdigit():
+        return int(size)
+    return int(size[:-1]) * SIZE_UNITS[size[-1]]
+
+
+def parse_blkid_output(output: str) -> dict:
+    """
+    Parse the output of `blkid` into a dictionary mapping each device name
+    (e.g. sda1) to a dictionary of its fields.
+    """
+    partitions_blkid = dict()
+    for line in output.strip().splitlines():
+        path, _, fields = line.partition(": ")
+        partitions_blkid[path.rsplit("/", 1)[-1]] = dict(BLKID_FIELD_RE.findall(fields))
+    return partitions_blkid
+
+
 # Returns true if block device with block_device_id is a partition; otherwise, returns false
 def is_partition(host_status, block_device_id):
     for disk in host_status["spec"]["storage"]["disks"]:
@@ -305,10 +327,7 @@ def get_host_status(connection: fabric.Connection, tridentCommand: str) -> dict:
     # Structure output
     output = result.stdout.strip()
 
-    yaml.add_multi_constructor(
-        "!", lambda loader, _, node: loader.construct_mapping(node)
-    )
-    return yaml.load(output, Loader=yaml.FullLoader)
+    return yaml.load(output, Loader=HostStatusLoader)
 
 
 # Runs 'mount' and returns the name of the block device mounted at root /
@@ -430,8 +449,10 @@ def test_users(connection, hostConfiguration):
                 else:
                     expected_groups[group].append(user_info["name"])
 
-    # Check users
-    result = connection.run("cat /etc/passwd")
+    # Check users and groups. Fetch both files in a single round trip,
+    # separated by a NUL byte.
+    result = connection.run("cat /etc/passwd && printf '\\0' && cat /etc/group")
+    passwd_output, group_output = result.stdout.split("\0", 1)
     # Expected output example:
     # root:x:0:0:root:/root:/bin/bash
     # bin:x:1:1:bin:/dev/null:/bin/false
@@ -440,17 +461,14 @@ def test_users(connection, hostConfiguration):
     # testing-user:x:1001:1001::/home/testing-user:/bin/bash
 
     # Structure output
-    users_system = set()
-    users_info = result.stdout.strip().splitlines()
-
-    for user_info in users_info:
-        users_system.add(user_info.split(":")[0])
+    users_system = {
+        user_info.partition(":")[0] for user_info in passwd_output.splitlines()
+    }
 
     for user in expected_users:
         assert user in users_system
 
     # Check groups
-    result = connection.run("cat /etc/group ")
     # Expected output example:
     # root:x:0:
     # bin:x:1:daemon
@@ -459,13 +477,12 @@ def test_users(connection, hostConfiguration):
     # tape:x:4:
     # tty:x:5:
 
-    # Structure output
-    users_by_group = dict()
-    groups_info = result.stdout.strip().splitlines()
-
-    for group_info in groups_info:
-        group_info_elements = group_info.split(":")
-        users_by_group[group_info_elements[0]] = set(group_info_elements[-1].split(","))
+    # Structure output: the group name is the first field and its members
+    # are the last one
+    users_by_group = {
+        group_info.partition(":")[0]: set(group_info.rpartition(":")[2].split(","))
+        for group_info in group_output.splitlines()
+    }
 
     for group in expected_groups:
         assert group in users_by_group
@@ -1,13 +1,30 @@
-from fabric import Connection, Config
+from collections import defaultdict
+import copy
+import functools
 import json
 import os
 import pytest
 import yaml
 
+# Prefer the libyaml-backed loader when PyYAML was built with it.
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# Markers that select the tests to run in each pipeline. The order matters
+# here; each element depends on the previous ones.
+SPECIAL_MARKERS = [
+    "compatible",
+    "weekly",
+    "daily",
+    "post_merge",
+    "pullrequest",
+    "validation",
+]
+
 # A key in the following path and the user name in the hostConfiguration are expected
-file_directory_path = os.path.dirname(os.path.realpath(__file__))
+file_directory_path = os.path.dirname(os.path.abspath(__file__))
 key_path = os.path.join(file_directory_path, "helpers/key")
 USERNAME = "testing-user"
+SSH_KEEPALIVE_INTERVAL_SECS = 30
 TRIDENT_EXECUTABLE_PATH = "/usr/bin/trident"
 # Expected location of Docker image:
 DOCKER_IMAGE_PATH = "/var/lib/trident/trident-container.tar.gz"
@@ -77,12 +94,25 @@ def connection(request):
     rsa_key = os.path.expanduser(request.config.getoption("--keypath"))
     runtime_env = request.config.getoption("--runtime-env")
 
-    config = Config(overrides={"connect_kwargs": {"key_filename": rsa_key}})
+    # fabric pulls in paramiko and cryptography; only import it once a
+    # connection is actually needed so that test collection stays fast.
+    from fabric import Connection, Config
+
+    # None of the remote commands read stdin; keep invoke from mirroring the
+    # local stdin to every command, which costs an extra thread per run().
+    config = Config(
+        overrides={
+            "connect_kwargs": {"key_filename": rsa_key},
+            "run": {"in_stream": False},
+        }
+    )
     ssh_connection = Connection(host=host, user=USERNAME, config=config)
 
     # Ensure that we can connect
     ssh_connection.open()
-    ssh_connection.run("hostname")
+    # The connection is shared by the whole session; keep it from being
+    # dropped by idle timeouts while long-running tests execute.
+    ssh_connection.transport.set_keepalive(SSH_KEEPALIVE_INTERVAL_SECS)
 
     if runtime_env == "container":
         getenforce_result = ssh_connection.run("sudo getenforce")
@@ -100,7 +130,7 @@ def connection(request):
     ssh_connection.close()
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def tridentCommand(request):
     runtime_env = request.config.getoption("--runtime-env")
 
@@ -113,30 +143,40 @@ def tridentCommand(request):
     return trident_command
 
 
+@functools.lru_cache(maxsize=None)
+def load_yaml(file_path):
+    """
+    Load the YAML document at the given path. Every configuration file is
+    parsed once per session; callers must not modify the returned document.
+    """
+    with open(file_path, "rb") as stream:
+        return yaml.load(stream, Loader=YAML_LOADER)
+
+
 @pytest.fixture
 def hostConfiguration(request):
     file_path = request.config.getoption("--configuration")
     tridentconfig_path = os.path.join(file_path, "trident-config.yaml")
-    with open(tridentconfig_path, "r") as stream:
-        try:
-            trident_Configuration = yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
-            return {}
+    try:
+        trident_Configuration = load_yaml(tridentconfig_path)
+    except yaml.YAMLError as exc:
+        print(exc)
+        return {}
 
-    return trident_Configuration
+    # load_yaml() shares one parsed document across the session; give each
+    # test its own copy so that a test modifying it cannot affect the others.
+    return copy.deepcopy(trident_Configuration)
 
 
 @pytest.fixture
 def isUki(request):
     file_path = request.config.getoption("--configuration")
     testselection_path = os.path.join(file_path, "test-selection.yaml")
-    with open(testselection_path, "r") as stream:
-        try:
-            test_Selection = yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
-            return {}
+    try:
+        test_Selection = load_yaml(testselection_path)
+    except yaml.YAMLError as exc:
+        print(exc)
+        return {}
 
     return "uki" in test_Selection.get("compatible", [])
 
@@ -152,32 +192,22 @@ def expectedHostStatusState(request):
 
 
 def define_tests(file_path):
-    with open(file_path, "r") as stream:
-        try:
-            test_markers = yaml.safe_load(stream)
-        except yaml.YAMLError as exc:
-            print(exc)
-            return
-
-    # Define tests:
-    special_markers = [
-        "compatible",
-        "weekly",
-        "daily",
-        "post_merge",
-        "pullrequest",
-        "validation",
-    ]  # The order matters here; each element depends on the previous ones.
-    actions = ["add", "remove"]
-    types = ["modules", "markers"]
-    # Structure:
-    tests_selected = {
-        special_marker: {action: {tp: set() for tp in types} for action in actions}
-        for special_marker in special_markers
-    }
+    try:
+        test_markers = load_yaml(file_path)
+    except yaml.YAMLError as exc:
+        print(exc)
+        return
+    if not test_markers:
+        return
+
+    # Define tests, by special marker, action and type. Entries are only
+    # created for the combinations that test-selection.yaml actually uses.
+    tests_selected = defaultdict(lambda: defaultdict(lambda: defaultdict(set)))
     # Add information
-    test_markers["compatible"] = {"add": test_markers.get("compatible", list())}
     for test_marker, test_marker_value in test_markers.items():
+        # 'compatible' is a plain list of tests to add.
+        if test_marker == "compatible":
+            test_marker_value = {"add": test_marker_value}
         for action, action_value in test_marker_value.items():
             for element in action_value:
                 if "::" in element:
@@ -190,42 +220,48 @@ def define_tests(file_path):
 def pytest_collection_modifyitems(config, items):
     configuration_path = config.getoption("--configuration")
     tests_path = os.path.join(configuration_path, "test-selection.yaml")
+    if not os.path.exists(tests_path):
+        return
     test_markers = define_tests(tests_path)
+    # Nothing is selected; leave the collected items untouched.
+    if not test_markers:
+        return
 
-    # Add special markers to functions (tests)
-    modules_per_marker = {marker: set() for marker in test_markers}
-    current_definition = set()
-    for marker_name, marker_tests in test_markers.items():
-        special_marker = getattr(pytest.mark, marker_name)
-        for item in items:
-            item_markers = set(item.keywords)
-            if item.nodeid in marker_tests["add"]["modules"]:
-                item.add_marker(special_marker)
-                modules_per_marker[marker_name].add(item.nodeid)
-                continue
-            if item.nodeid in marker_tests["remove"]["modules"]:
-                continue
-            if item_markers & marker_tests["remove"]["markers"]:
-                continue
-            if item_markers & marker_tests["add"]["markers"]:
-                item.add_marker(special_marker)
-                modules_per_marker[marker_name].add(item.nodeid)
-                continue
-            if item.nodeid in current_definition:
+    # Add special markers to functions (tests). Each item is visited once and
+    # run through the special markers in order; an item that no rule of a
+    # marker matches keeps the selection it got from the previous marker.
+    special_marks = [
+        (marker_name, getattr(pytest.mark, marker_name), test_markers[marker_name])
+        for marker_name in SPECIAL_MARKERS
+    ]
+    # Each item is visited once, so plain lists hold unique node IDs.
+    modules_per_marker = {marker: [] for marker in SPECIAL_MARKERS}
+    for item in items:
+        nodeid = item.nodeid
+        item_markers = set(item.keywords)
+        selected = False
+        for marker_name, special_marker, marker_tests in special_marks:
+            if nodeid in marker_tests["add"]["modules"]:
+                selected = True
+            elif nodeid in marker_tests["remove"]["modules"]:
+                selected = False
+            elif not item_markers.isdisjoint(marker_tests["remove"]["markers"]):
+                selected = False
+            elif not item_markers.isdisjoint(marker_tests["add"]["markers"]):
+                selected = True
+            if selected:
                 item.add_marker(special_marker)
-                modules_per_marker[marker_name].add(item.nodeid)
-                continue
-        current_definition = modules_per_marker[marker_name]
+                # Keep the cached keywords in sync with item.keywords.
+                item_markers.add(marker_name)
+                modules_per_marker[marker_name].append(nodeid)
 
     # Save the tests selected by each special marker
     marker_file_test = dict()
     for marker, modules in modules_per_marker.items():
-        marker_file_test[marker] = dict()
+        marker_file_test[marker] = defaultdict(list)
         for module in modules:
-            module_file, module_function = module.split("::", 1)
-            if not module_file in marker_file_test[marker]:
-                marker_file_test[marker][module_file] = list()
+            module_file, _, module_function = module.partition("::")
             marker_file_test[marker][module_file].append(module_function)
     mft_file = os.path.join(configuration_path, "ts.json")
     with open(mft_file, "w") as ts:
-        json.dump(marker_file_test, ts, indent=4)
+        json.dump(marker_file_test, ts, separators=(",", ":"))
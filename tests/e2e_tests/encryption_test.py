@@ -1,116 +1,167 @@
-import json
+from __future__ import annotations
+
+import contextlib
+import re
+import shlex
 import typing
-import fabric
 import pytest
 
-from base_test import get_host_status
+from dataclasses import dataclass
+
+# orjson is optional; it decodes the LUKS header dumps faster when present.
+try:
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+if typing.TYPE_CHECKING:
+    import fabric
 
 pytestmark = [pytest.mark.encryption]
 
+# Marks the start of each command's output in the output of sudo_batch().
+BATCH_TAG_RE = re.compile(r"^==TAG==(.*)==$", re.MULTILINE)
+
+# Lists the resolved paths of all active swap devices.
+ACTIVE_SWAPS_CMD = (
+    "swapon --show=NAME --raw --bytes --noheadings | xargs -r readlink -f"
+)
 
-def get_filesystem(hostConfiguration: dict, fsId: str) -> typing.Optional[dict]:
+
+@dataclass
+class StorageIndex:
     """
-    Get the filesystem for the given filesystem ID in the Trident
-    configuration, or None if no such filesystem exists.
+    The storage section of the Trident configuration indexed by ID, so that
+    the checks of each encryption volume can look devices up directly
+    instead of scanning the configuration.
     """
 
-    for fs in hostConfiguration["storage"]["filesystems"]:
-        if fs["deviceId"] == fsId:
-            return fs
+    filesystems: dict[str, dict]
+    # Maps the device ID of each mounted filesystem to its mount point path.
+    mountPointPaths: dict[str, str]
+    swaps: dict[str, dict]
+    # Maps the ID of each A/B update volume to its pair and whether it is
+    # volume A of the pair.
+    abUpdateVolumes: dict[str, typing.Tuple[dict, bool]]
+    raidArrayNames: dict[str, str]
+    partitions: dict[str, dict]
+
+
+def build_storage_index(hostConfiguration: dict) -> StorageIndex:
+    """Index the storage section of the given Trident configuration."""
+
+    storage = hostConfiguration["storage"]
+
+    filesystems = {}
+    mountPointPaths = {}
+    for fs in storage["filesystems"]:
+        fsId = fs.get("deviceId")
+        filesystems[fsId] = fs
+        if "mountPoint" in fs:
+            mountPoint = fs["mountPoint"]
+            mountPointPaths[fsId] = (
+                mountPoint if isinstance(mountPoint, str) else mountPoint["path"]
+            )
+
+    abUpdateVolumes = {}
+    for abUpdateVolumePair in storage.get("abUpdate", {}).get("volumePairs", []):
+        abUpdateVolumes[abUpdateVolumePair["volumeAId"]] = (abUpdateVolumePair, True)
+        abUpdateVolumes[abUpdateVolumePair["volumeBId"]] = (abUpdateVolumePair, False)
+
+    swaps = {}
+    for swap in storage.get("swap", []):
+        if isinstance(swap, str):
+            swaps[swap] = {"deviceId": swap}
+        else:
+            swaps[swap["deviceId"]] = swap
+
+    return StorageIndex(
+        filesystems=filesystems,
+        mountPointPaths=mountPointPaths,
+        swaps=swaps,
+        abUpdateVolumes=abUpdateVolumes,
+        raidArrayNames={
+            a["id"]: a["name"] for a in storage.get("raid", {}).get("software", [])
+        },
+        partitions={p["id"]: p for d in storage["disks"] for p in d["partitions"]},
+    )
 
-    return None
 
+def get_filesystem(storageIndex: StorageIndex, fsId: str) -> typing.Optional[dict]:
+    """
+    Get the filesystem for the given filesystem ID in the Trident
+    configuration, or None if no such filesystem exists.
+    """
 
-def get_swap(hostConfiguration: dict, devId: str) -> typing.Optional[dict]:
-    """Gets the swap device associated with the provided device id, if any."""
+    return storageIndex.filesystems.get(fsId)
 
-    for swap in hostConfiguration["storage"].get("swap", []):
-        if isinstance(swap, str) and swap == devId:
-            return {"deviceId": devId}
-        elif isinstance(swap, dict) and swap["deviceId"] == devId:
-            return swap
 
-    return None
+def get_mount_point_path(storageIndex: StorageIndex, fsId: str) -> typing.Optional[str]:
+    """
+    Get the mount point path of the filesystem with the given ID, or None if
+    no such filesystem exists or it is not mounted.
+    """
 
+    return storageIndex.mountPointPaths.get(fsId)
 
-def get_active_swaps(connection: fabric.Connection) -> typing.Set[str]:
-    active = sudo(
-        connection,
-        "swapon --show=NAME --raw --bytes --noheadings | xargs -I @ readlink -f @",
-    )
 
-    return set(active.splitlines())
+def get_swap(storageIndex: StorageIndex, devId: str) -> typing.Optional[dict]:
+    """Gets the swap device associated with the provided device id, if any."""
+
+    return storageIndex.swaps.get(devId)
 
 
 def get_child_ab_update_volume_pair(
-    hostConfiguration: dict, cryptId: str
+    storageIndex: StorageIndex, cryptId: str
 ) -> typing.Tuple[typing.Optional[dict], bool]:
-    if "abUpdate" not in hostConfiguration["storage"]:
-        return None, False
-
-    for abUpdateVolumePair in hostConfiguration["storage"]["abUpdate"]["volumePairs"]:
-        if abUpdateVolumePair["volumeAId"] == cryptId:
-            return abUpdateVolumePair, True
-
-        if abUpdateVolumePair["volumeBId"] == cryptId:
-            return abUpdateVolumePair, False
-
-    return None, False
+    return storageIndex.abUpdateVolumes.get(cryptId, (None, False))
 
 
 def get_raid_software_array_name(
-    hostConfiguration: dict, aId: str
+    storageIndex: StorageIndex, aId: str
 ) -> typing.Optional[str]:
     """
     Get the name of the RAID software array with the given ID in the
     Trident configuration, or None if no such array exists.
     """
 
-    for a in hostConfiguration["storage"]["raid"]["software"]:
-        if a["id"] == aId:
-            return a["name"]
+    return storageIndex.raidArrayNames.get(aId)
 
-    return None
 
-
-def get_disk_partition(hostConfiguration: dict, pId: str) -> typing.Optional[dict]:
+def get_disk_partition(storageIndex: StorageIndex, pId: str) -> typing.Optional[dict]:
     """
     Check if a disk partition with the given ID exists in the Trident
     configuration.
     """
 
-    for d in hostConfiguration["storage"]["disks"]:
-        for p in d["partitions"]:
-            if p["id"] == pId:
-                return p
-
-    return None
+    return storageIndex.partitions.get(pId)
 
 
 def read_dict_from_lines(lines: list[str]) -> dict:
     """
     Read a dictionary from a list of lines in the format "key: value".
+    Lines without a colon are skipped.
     """
 
-    d = {}
-    for line in lines:
-        k, v = line.split(":", 1)
-        d[k.strip()] = v.strip()
-
-    return d
+    return {
+        k.strip(): v.strip()
+        for k, sep, v in (line.partition(":") for line in lines)
+        if sep
+    }
 
 
 def read_table_from_stdout(stdout: str) -> list[dict]:
     """
     Read a table from the given stdout string. The first line is expected
     to contain the column headers, and the following lines are expected to
-    contain the rows. The columns are separated by whitespace.
+    contain the rows. The columns are separated by whitespace, and any
+    whitespace left over in a row is kept in its last column.
     """
 
     lines = stdout.splitlines()
-    header = [c.strip() for c in lines[0].split()]
-    rows = [[c.strip() for c in line.split()] for line in lines[1:]]
-    return [dict(zip(header, r)) for r in rows]
+    header = lines[0].split()
+    maxsplit = len(header) - 1
+    return [dict(zip(header, line.split(maxsplit=maxsplit))) for line in lines[1:]]
 
 
 def sudo(connection: fabric.Connection, cmd: str) -> str:
@@ -122,6 +173,44 @@ def sudo(connection: fabric.Connection, cmd: str) -> str:
     return res.stdout.strip()
 
 
+@contextlib.contextmanager
+def selinux_permissive(connection: fabric.Connection):
+    """
+    Temporarily switch SELinux to Permissive mode on the host, if it is in
+    Enforcing mode, and switch it back on exit.
+
+    Dumping the LUKS header requires additional SELinux permission for
+    lvm_t: allow lvm_t initrc_runtime_t:dir { read }. This is a quirk of the
+    testing infra, and this perm shouldn't be part of the Trident policy.
+    """
+    # Read the mode and switch it in the same remote shell.
+    script = (
+        'mode=$(getenforce); echo "$mode"; [ "$mode" != Enforcing ] || setenforce 0'
+    )
+    enforcing = sudo(connection, f"bash -c {shlex.quote(script)}") == "Enforcing"
+    try:
+        yield
+    finally:
+        if enforcing:
+            sudo(connection, "setenforce 1")
+
+
+def sudo_batch(connection: fabric.Connection, cmds: dict[str, str]) -> dict[str, str]:
+    """
+    Run the given commands, keyed by tag, with sudo in a single remote shell
+    and return the stripped stdout of each command under the same tag. The
+    shell stops at the first command that fails, which fails the run.
+    """
+    script = "set -e\n" + "".join(
+        f"printf '\\n==TAG==%s==\\n' {shlex.quote(tag)}\n{cmd}\n"
+        for tag, cmd in cmds.items()
+    )
+    res = connection.run(f"sudo bash -c {shlex.quote(script)}")
+
+    parts = BATCH_TAG_RE.split(res.stdout)
+    return {tag: out.strip() for tag, out in zip(parts[1::2], parts[2::2])}
+
+
 def get_blkid_output(connection: fabric.Connection) -> dict:
     """
     Get the output of `blkid --output export` and return a dictionary
@@ -144,35 +233,21 @@ def get_blkid_output(connection: fabric.Connection) -> dict:
     cmd = "blkid --output export"
     stdout = sudo(connection, cmd)
 
+    # Each device is a block of KEY=value lines, separated by a blank line.
     devs: dict[str, dict] = {}
-    name = None
-    for line in stdout.splitlines():
-        if line == "":
+    for record in stdout.split("\n\n"):
+        if not record:
             continue
 
-        k, v = line.split("=", 1)
-        if k == "DEVNAME":
-            name = v
-            devs[name] = {}
-        elif name is not None:
-            devs[name][k] = v
-        else:
-            raise ValueError(f"Unexpected line: {line}")
+        dev = dict(line.split("=", 1) for line in record.splitlines())
+        if "DEVNAME" not in dev:
+            raise ValueError(f"Unexpected record: {record}")
+        devs[dev.pop("DEVNAME")] = dev
 
     return devs
 
 
-def check_exists(connection: fabric.Connection, path: str) -> None:
-    """
-    Check if the given path exists by running `ls` on it.
-    """
-    cmd = f"ls {path}"
-    _ = sudo(connection, cmd)
-
-
-def check_cryptsetup_status(
-    connection: fabric.Connection, name: str, isInUse: bool
-) -> dict:
+def check_cryptsetup_status(stdout: str, name: str, isInUse: bool) -> dict:
     """
     Check the output of `cryptsetup status` for the given device name.
 
@@ -191,8 +266,6 @@ def check_cryptsetup_status(
         mode:    read/write
     """
 
-    cmd = f"cryptsetup status {name}"
-    stdout = sudo(connection, cmd)
     lines = stdout.splitlines()
 
     # LUKS2-encrypted volumes are always opened and therefore always
@@ -225,7 +298,7 @@ def check_cryptsetup_status(
     return status
 
 
-def check_dmsetup_info(connection: fabric.Connection, name: str, swap: bool) -> None:
+def check_dmsetup_info(stdout: str, name: str, swap: bool) -> None:
     """
     Check the output of `dmsetup info` for the given device name.
 
@@ -242,8 +315,6 @@ def check_dmsetup_info(connection: fabric.Connection, name: str, swap: bool) ->
         Number of targets: 1
         UUID: CRYPT-LUKS2-475f03514bb749bbb9af1f53f94b91cb-web
     """
-    cmd = f"dmsetup info {name}"
-    stdout = sudo(connection, cmd)
     info = read_dict_from_lines(stdout.splitlines())
 
     assert "Name" in info, f"Expected Name to be in {info!r}"
@@ -259,21 +330,20 @@ def check_dmsetup_info(connection: fabric.Connection, name: str, swap: bool) ->
         info["Tables present"] == expected_tables_present
     ), f"Expected Tables present to be {expected_tables_present!r}, got {info['Tables present']!r}"
 
+    uuid = info["UUID"]
     crypt_kind = "PLAIN" if swap else "LUKS2"
     expected_uuid_prefix = f"CRYPT-{crypt_kind}-"
-    assert info["UUID"].startswith(
+    assert uuid.startswith(
         expected_uuid_prefix
-    ), f"Expected UUID to start with {expected_uuid_prefix!r}, got {info['UUID']!r}"
+    ), f"Expected UUID to start with {expected_uuid_prefix!r}, got {uuid!r}"
 
     expected_uuid_suffix = f"-{name}"
-    assert info["UUID"].endswith(
-        f"-{name}"
-    ), f"Expected UUID to end with {expected_uuid_suffix!r}, got {info['UUID']!r}"
+    assert uuid.endswith(
+        expected_uuid_suffix
+    ), f"Expected UUID to end with {expected_uuid_suffix!r}, got {uuid!r}"
 
 
-def check_findmnt(
-    connection: fabric.Connection, target: str, source: str, isActive: bool
-) -> None:
+def check_findmnt(stdout: str, target: str, source: str, isActive: bool) -> None:
     """
     Check the output of `findmnt` for the given path and encrypted device.
 
@@ -283,8 +353,6 @@ def check_findmnt(
         TARGET SOURCE FSTYPE OPTIONS
         /mnt/web /dev/mapper/web ext4 rw,relatime
     """
-    cmd = f"findmnt {target}"
-    stdout = sudo(connection, cmd)
     table = read_table_from_stdout(stdout)
 
     assert (
@@ -311,31 +379,35 @@ def check_findmnt(
     assert len(table) == 1, f"Expected one row, got {len(table)}. Table: {table}"
 
 
+def build_partlabel_index(blockDevs: dict) -> dict[str, str]:
+    """
+    Map the PARTLABEL of each device in the given blkid output to the
+    device path. If several devices share a PARTLABEL, the first one wins.
+    """
+
+    return {
+        dev["PARTLABEL"]: devId
+        for devId, dev in reversed(blockDevs.items())
+        if "PARTLABEL" in dev
+    }
+
+
 def get_block_dev_path_by_partlabel(
-    blockDevs: dict, label: str
+    partlabels: dict[str, str], label: str
 ) -> typing.Optional[str]:
     """
     Get the device path for the device with the given PARTLABEL, or None
     if no such device exists.
     """
 
-    for devId, dev in blockDevs.items():
-        if "PARTLABEL" in dev and dev["PARTLABEL"] == label:
-            return devId
+    return partlabels.get(label)
 
-    return None
 
-
-def check_crypsetup_luks_dump(
-    connection: fabric.Connection,
-    tridentCommand: str,
-    cryptDevPath: str,
-    isUki: bool,
-) -> None:
+def check_crypsetup_luks_dump(stdout: str, isUki: bool) -> None:
     """
-    Check the output of `cryptsetup luksDump --dump-json-metadata` for the
-    given device path. The output will differ depending on whether the
-    encryption is based on a pcrlock policy or not.
+    Check the given output of `cryptsetup luksDump --dump-json-metadata`.
+    The output will differ depending on whether the encryption is based on
+    a pcrlock policy or not.
 
     Example output for a testing flow using a UKI target OS image, where a
     pcrlock policy is used:
@@ -484,56 +556,40 @@ def check_crypsetup_luks_dump(
         }
 
     """
-    # Running this command requires additional SELinux permission for lvm_t:
-    # allow lvm_t initrc_runtime_t:dir { read }.
-    # This is a quirk of the testing infra, and this perm shouldn't be part of
-    # the Trident policy. So, temporarily switch to Permissive mode.
-    enforcing = sudo(connection, "getenforce").strip() == "Enforcing"
-    if enforcing:
-        sudo(connection, "setenforce 0")
+    assert stdout, "Expected cryptsetup luksDump to print the LUKS metadata"
+    dump = json_loads(stdout)
 
-    stdout = sudo(
-        connection, f"cryptsetup luksDump --dump-json-metadata {cryptDevPath}"
-    )
-    dump = json.loads(stdout)
-
-    # Revert to Enforcing mode
-    if enforcing:
-        sudo(connection, "setenforce 1")
+    digest = dump["digests"]["0"]
+    tokens = dump["tokens"]
+    keyslots = dump["keyslots"]
 
     # Validate type of digest to be pbkdf2
-    actual = dump["digests"]["0"]["type"]
+    actual = digest["type"]
     expected = "pbkdf2"
     assert (
         actual == expected
     ), f"Expected digest type to be {expected!r}, got {actual!r}"
 
     # Validate hash type to be sha512
-    actual = dump["digests"]["0"]["hash"]
+    actual = digest["hash"]
     expected = "sha512"
     assert (
         actual == expected
     ), f"Expected digest hash to be {expected!r}, got {actual!r}"
 
-    # Check Host Status to see if image is UKI or not
-    host_status = get_host_status(connection, tridentCommand)
-
     # For both UKI and grub target OS images, we expect to see a single token 1
+    assert "0" in tokens, f"Expected token 0 to be in {tokens!r}, got {tokens!r}"
+    token = tokens["0"]
     assert (
-        "0" in dump["tokens"]
-    ), f"Expected token 0 to be in {dump['tokens']!r}, got {dump['tokens']!r}"
+        "1" in token["keyslots"]
+    ), f"Expected key slot 1 to be in {token['keyslots']!r}, got {token['keyslots']!r}"
+    assert len(tokens) == 1, f"Expected one token, got {len(tokens)}. Tokens: {tokens}"
     assert (
-        "1" in dump["tokens"]["0"]["keyslots"]
-    ), f"Expected key slot 1 to be in {dump['tokens']['0']['keyslots']!r}, got {dump['tokens']['0']['keyslots']!r}"
-    assert (
-        len(dump["tokens"]) == 1
-    ), f"Expected one token, got {len(dump['tokens'])}. Tokens: {dump['tokens']}"
-    assert (
-        len(dump["tokens"]["0"]["keyslots"]) == 1
-    ), f"Expected one key slot for the token, got {len(dump['tokens']['0']['keyslots'])}. Key slots: {dump['tokens']['0']['keyslots']}"
+        len(token["keyslots"]) == 1
+    ), f"Expected one key slot for the token, got {len(token['keyslots'])}. Key slots: {token['keyslots']}"
 
     # Validate token type to be systemd-tpm2
-    actual = dump["tokens"]["0"]["type"]
+    actual = token["type"]
     expected = "systemd-tpm2"
     assert actual == expected, f"Expected token type to be {expected!r}, got {actual!r}"
 
@@ -542,63 +598,65 @@ def check_crypsetup_luks_dump(
     # tpm2-pcrs is a vector with PCR 7.
     if isUki:
         assert (
-            dump["tokens"]["0"]["tpm2_pcrlock"] is True
-        ), f"Expected tpm2_pcrlock to be True for UKI image, got {dump['tokens']['0']['tpm2_pcrlock']!r}"
+            token["tpm2_pcrlock"] is True
+        ), f"Expected tpm2_pcrlock to be True for UKI image, got {token['tpm2_pcrlock']!r}"
         assert (
-            dump["tokens"]["0"]["tpm2-pcrs"] == []
-        ), f"Expected tpm2-pcrs to be an empty vector for UKI image, got {dump['tokens']['0']['tpm2-pcrs']!r}"
+            token["tpm2-pcrs"] == []
+        ), f"Expected tpm2-pcrs to be an empty vector for UKI image, got {token['tpm2-pcrs']!r}"
     else:
         assert (
-            dump["tokens"]["0"]["tpm2_pcrlock"] is False
-        ), f"Expected tpm2_pcrlock to be False for non-UKI image, got {dump['tokens']['0']['tpm2_pcrlock']!r}"
+            token["tpm2_pcrlock"] is False
+        ), f"Expected tpm2_pcrlock to be False for non-UKI image, got {token['tpm2_pcrlock']!r}"
         # Expect PCR 7
-        assert dump["tokens"]["0"]["tpm2-pcrs"] == [
+        assert token["tpm2-pcrs"] == [
             7
-        ], f"Expected tpm2-pcrs to be [7] for non-UKI image, got {dump['tokens']['0']['tpm2-pcrs']!r}"
+        ], f"Expected tpm2-pcrs to be [7] for non-UKI image, got {token['tpm2-pcrs']!r}"
 
     # Validate that each image has a single keyslot, 1
     assert (
-        len(dump["keyslots"]) == 1
-    ), f"Expected one key slot, got {len(dump['keyslots'])}. Key slots: {dump['keyslots']}"
+        len(keyslots) == 1
+    ), f"Expected one key slot, got {len(keyslots)}. Key slots: {keyslots}"
     assert (
-        "1" in dump["keyslots"]
-    ), f"Expected key slot 1 to be in {dump['keyslots']!r}, got {dump['keyslots']!r}"
+        "1" in keyslots
+    ), f"Expected key slot 1 to be in {keyslots!r}, got {keyslots!r}"
+    keyslot = keyslots["1"]
 
     # Validate key slot type and other properties
     expected = "luks2"
-    actual = dump["keyslots"]["1"]["type"]
+    actual = keyslot["type"]
     assert (
         actual == expected
     ), f"Expected keyslot 1 type to be {expected!r}, got {actual!r}"
 
     # Validate key slot KDF type
     expected = "pbkdf2"
-    actual = dump["keyslots"]["1"]["kdf"]["type"]
+    actual = keyslot["kdf"]["type"]
     assert (
         actual == expected
     ), f"Expected keyslot 1 KDF type to be {expected!r}, got {actual!r}"
 
     # Validate key slot KDF hash
     expected = "sha512"
-    actual = dump["keyslots"]["1"]["kdf"]["hash"]
+    actual = keyslot["kdf"]["hash"]
     assert (
         actual == expected
     ), f"Expected keyslot 1 KDF hash to be {expected!r}, got {actual!r}"
 
     # Validate key slot area type
     expected = "aes-xts-plain64"
-    actual = dump["keyslots"]["1"]["area"]["encryption"]
+    actual = keyslot["area"]["encryption"]
     assert (
         actual == expected
     ), f"Expected keyslot 1 area encryption to be {expected!r}, got {actual!r}"
 
 
 def check_parent_devices(
-    connection: fabric.Connection,
-    hostConfiguration: dict,
+    storageIndex: StorageIndex,
     isUki: bool,
-    tridentCommand: str,
     blockDevs: dict,
+    partlabels: dict[str, str],
+    outputs: dict[str, str],
+    cryptId: str,
     cryptDevId: str,
 ) -> None:
     """
@@ -606,18 +664,18 @@ def check_parent_devices(
     It can be either a disk partition or a RAID array. If a RAID
     """
 
-    part = get_disk_partition(hostConfiguration, cryptDevId)
+    part = get_disk_partition(storageIndex, cryptDevId)
     if part is not None:
-        cryptDevPath = get_block_dev_path_by_partlabel(blockDevs, cryptDevId)
+        cryptDevPath = get_block_dev_path_by_partlabel(partlabels, cryptDevId)
         assert (
             cryptDevPath is not None
         ), f"Expected device with PARTLABEL {cryptDevId} to be in {blockDevs}"
     else:
-        cryptDevName = get_raid_software_array_name(hostConfiguration, cryptDevId)
+        cryptDevName = get_raid_software_array_name(storageIndex, cryptDevId)
         assert (
             cryptDevName is not None
         ), f"Expected {cryptDevId} to be a disk partition or RAID array"
-        cryptDevPath = sudo(connection, f"readlink -f /dev/md/{cryptDevName}")
+        cryptDevPath = outputs[f"{cryptId}:raid-path"]
 
     expectedType = "crypto_LUKS"
     actualType = blockDevs[cryptDevPath]["TYPE"]
@@ -625,31 +683,21 @@ def check_parent_devices(
         actualType == expectedType
     ), f"Expected TYPE to be {expectedType!r}, got {actualType!r}"
 
-    check_crypsetup_luks_dump(connection, tridentCommand, cryptDevPath, isUki)
+    check_crypsetup_luks_dump(outputs[f"{cryptId}:luks-dump"], isUki)
 
 
-def check_crypt_device(
-    connection: fabric.Connection,
-    hostConfiguration: dict,
-    isUki: bool,
-    tridentCommand: str,
-    abActiveVolume: str,
-    blockDevs: dict,
-    cryptId: str,
-    cryptDevName: str,
-    cryptDevId: str,
-) -> None:
-    cryptDevicePath = f"/dev/mapper/{cryptDevName}"
-
-    check_parent_devices(
-        connection, hostConfiguration, isUki, tridentCommand, blockDevs, cryptDevId
-    )
-
-    swap = False
+def get_crypt_device_mount(
+    storageIndex: StorageIndex, abActiveVolume: str, cryptId: str
+) -> typing.Tuple[typing.Optional[str], bool, bool]:
+    """
+    Get the mount point path of the filesystem on the given crypt device
+    (None for swap), whether the device is expected to be in use, and
+    whether it is used as swap.
+    """
     isInUse = True
 
     childAbUpdateVolumePair, isVolumeA = get_child_ab_update_volume_pair(
-        hostConfiguration, cryptId
+        storageIndex, cryptId
     )
     if childAbUpdateVolumePair is not None:
         assert abActiveVolume in [
@@ -660,71 +708,156 @@ def check_crypt_device(
             abActiveVolume == "volume-b" and not isVolumeA
         )
 
-        fs = get_filesystem(hostConfiguration, childAbUpdateVolumePair["id"])
+        fsId = childAbUpdateVolumePair["id"]
         assert (
-            fs is not None
-        ), f"Expected filesystem for child ab update volume pair {childAbUpdateVolumePair['id']}"
+            get_filesystem(storageIndex, fsId) is not None
+        ), f"Expected filesystem for child ab update volume pair {fsId}"
+        mpPath = get_mount_point_path(storageIndex, fsId)
         assert (
-            "mountPoint" in fs
-        ), f"Expected mount point for child ab update volume pair {childAbUpdateVolumePair['id']}"
-        mpPath = (
-            fs["mountPoint"]
-            if isinstance(fs["mountPoint"], str)
-            else fs["mountPoint"]["path"]
-        )
-        check_exists(connection, mpPath)
-        check_findmnt(connection, mpPath, cryptDevicePath, isInUse)
-    elif swap := get_swap(hostConfiguration, cryptId) is not None:
-        swaps = get_active_swaps(connection)
-        real_path = sudo(connection, f"readlink -f {cryptDevicePath}")
-        assert (
-            real_path in swaps,
-            f"Expected '{real_path}' to be in active swaps: {swaps}",
-        )
+            mpPath is not None
+        ), f"Expected mount point for child ab update volume pair {fsId}"
+    elif get_swap(storageIndex, cryptId) is not None:
+        return None, isInUse, True
     else:
-        fs = get_filesystem(hostConfiguration, cryptId)
         assert (
-            fs is not None
+            get_filesystem(storageIndex, cryptId) is not None
         ), f"Expected filesystem for encryption volume {cryptId} when it has no child ab update volume pair"
 
+        mpPath = get_mount_point_path(storageIndex, cryptId)
         assert (
-            "mountPoint" in fs,
-            f"Expected filesystem of encryption volume {cryptId} to be mounted",
-        )
+            mpPath is not None
+        ), f"Expected filesystem of encryption volume {cryptId} to be mounted"
+
+    return mpPath, isInUse, False
+
+
+def get_crypt_device_commands(
+    storageIndex: StorageIndex,
+    abActiveVolume: str,
+    partlabels: dict[str, str],
+    crypt: dict,
+) -> typing.Tuple[dict[str, str], dict[str, str]]:
+    """
+    Get the commands that probe the given encryption volume and the paths
+    whose real path it needs, both keyed by the tags that
+    check_crypt_device() reads their output from. The LUKS header dump must
+    run with SELinux in Permissive mode, see selinux_permissive().
+    """
+    cryptId = crypt["id"]
+    cryptDevName = crypt["deviceName"]
+    cryptDevicePath = f"/dev/mapper/{cryptDevName}"
+    cmds = {}
+    links = {}
 
-        mpPath = (
-            fs["mountPoint"]
-            if isinstance(fs["mountPoint"], str)
-            else fs["mountPoint"]["path"]
+    backingDevPath = None
+    if get_disk_partition(storageIndex, crypt["deviceId"]) is not None:
+        backingDevPath = get_block_dev_path_by_partlabel(partlabels, crypt["deviceId"])
+    else:
+        raidName = get_raid_software_array_name(storageIndex, crypt["deviceId"])
+        if raidName is not None:
+            backingDevPath = f"/dev/md/{raidName}"
+            links[f"{cryptId}:raid-path"] = backingDevPath
+
+    # A missing backing device is reported by check_parent_devices(). So is
+    # one that is not LUKS formatted, so do not let a failing dump abort the
+    # batch before that check gets to run.
+    if backingDevPath is not None:
+        cmds[f"{cryptId}:luks-dump"] = (
+            "cryptsetup luksDump --dump-json-metadata "
+            f"{shlex.quote(backingDevPath)} || true"
         )
 
-        check_exists(connection, mpPath)
-        check_findmnt(connection, mpPath, cryptDevicePath, isInUse)
+    mpPath, _, _ = get_crypt_device_mount(storageIndex, abActiveVolume, cryptId)
+    if mpPath is not None:
+        cmds[f"{cryptId}:mount-exists"] = f"test -e {shlex.quote(mpPath)}"
+        cmds[f"{cryptId}:findmnt"] = f"findmnt {shlex.quote(mpPath)}"
+    else:
+        links[f"{cryptId}:real-path"] = cryptDevicePath
 
-    check_exists(connection, cryptDevicePath)
-    check_cryptsetup_status(connection, cryptDevName, isInUse)
-    check_dmsetup_info(connection, cryptDevName, swap)
+    cmds[f"{cryptId}:exists"] = f"test -e {shlex.quote(cryptDevicePath)}"
+    cmds[f"{cryptId}:status"] = f"cryptsetup status {shlex.quote(cryptDevName)}"
+    cmds[f"{cryptId}:info"] = f"dmsetup info {shlex.quote(cryptDevName)}"
+    return cmds, links
+
+
+def check_crypt_device(
+    storageIndex: StorageIndex,
+    isUki: bool,
+    abActiveVolume: str,
+    blockDevs: dict,
+    partlabels: dict[str, str],
+    outputs: dict[str, str],
+    cryptId: str,
+    cryptDevName: str,
+    cryptDevId: str,
+) -> None:
+    cryptDevicePath = f"/dev/mapper/{cryptDevName}"
+
+    check_parent_devices(
+        storageIndex,
+        isUki,
+        blockDevs,
+        partlabels,
+        outputs,
+        cryptId,
+        cryptDevId,
+    )
+
+    mpPath, isInUse, swap = get_crypt_device_mount(
+        storageIndex, abActiveVolume, cryptId
+    )
+    if swap:
+        swaps = set(outputs["swaps"].splitlines())
+        real_path = outputs[f"{cryptId}:real-path"]
+        assert (
+            real_path in swaps
+        ), f"Expected '{real_path}' to be in active swaps: {swaps}"
+    else:
+        check_findmnt(outputs[f"{cryptId}:findmnt"], mpPath, cryptDevicePath, isInUse)
+
+    check_cryptsetup_status(outputs[f"{cryptId}:status"], cryptDevName, isInUse)
+    check_dmsetup_info(outputs[f"{cryptId}:info"], cryptDevName, swap)
 
 
 def test_encryption(
     connection: fabric.Connection,
     hostConfiguration: dict,
     isUki: bool,
-    tridentCommand: str,
     abActiveVolume: str,
 ) -> None:
     blockDevs = get_blkid_output(connection)
+    partlabels = build_partlabel_index(blockDevs)
 
     storageConfig = hostConfiguration["storage"]
     encryptionConfig = storageConfig["encryption"]
+    storageIndex = build_storage_index(hostConfiguration)
+
+    # Run the probes of all volumes in a single remote shell rather than
+    # paying an SSH round trip for each command.
+    cmds = {"swaps": ACTIVE_SWAPS_CMD}
+    links = {}
+    for crypt in encryptionConfig["volumes"]:
+        cryptCmds, cryptLinks = get_crypt_device_commands(
+            storageIndex, abActiveVolume, partlabels, crypt
+        )
+        cmds.update(cryptCmds)
+        links.update(cryptLinks)
+    # Resolve the RAID array and swap device paths of all volumes with a
+    # single readlink, which prints one real path per argument.
+    if links:
+        cmds["real-paths"] = "readlink -f " + " ".join(map(shlex.quote, links.values()))
+    with selinux_permissive(connection):
+        outputs = sudo_batch(connection, cmds)
+    outputs.update(zip(links, outputs.pop("real-paths", "").splitlines()))
+
     for crypt in encryptionConfig["volumes"]:
         check_crypt_device(
-            connection,
-            hostConfiguration,
+            storageIndex,
             isUki,
-            tridentCommand,
             abActiveVolume,
             blockDevs,
+            partlabels,
+            outputs,
             crypt["id"],
             crypt["deviceName"],
             crypt["deviceId"],
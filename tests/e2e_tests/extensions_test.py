@@ -1,9 +1,14 @@
-import fabric
+from __future__ import annotations
+
 import pytest
 import json
 
 from base_test import get_host_status
 from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import fabric
 
 pytestmark = [pytest.mark.extensions]
 
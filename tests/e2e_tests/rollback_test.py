@@ -1,8 +1,13 @@
-import fabric
+from __future__ import annotations
+
 import pytest
 import yaml
 
 from base_test import get_host_status
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import fabric
 
 pytestmark = [pytest.mark.rollback]
 
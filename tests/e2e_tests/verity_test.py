@@ -4,7 +4,11 @@ import yaml
 import re
 import logging
 
-from base_test import get_raid_name_from_device_name, get_host_status
+from base_test import (
+    get_raid_name_from_device_name,
+    get_host_status,
+    parse_blkid_output,
+)
 
 pytestmark = [pytest.mark.verity]
 
@@ -40,19 +44,7 @@ def test_verity_root(connection, hostConfiguration, tridentCommand, abActiveVolu
     # Assert if /dev/mapper/root has been generated properly.
     assert "/dev/mapper/root" in part_path_set
 
-    partitions_blkid = dict()
-    for partition in output_blkid:
-        partition_dict = dict()
-        # Extract partition's name (ex: sda1)
-        name_info = partition.split(": ")
-        name = name_info[0].split("/")[-1]
-        # By line structure output into a dictionary with the partition information
-        for info in name_info[1].split():
-            field_value = info.split("=")
-            if len(field_value) == 2:
-                partition_dict[field_value[0]] = field_value[1].replace('"', "")
-        # Adding information to a dictionary for each partition
-        partitions_blkid[name] = partition_dict
+    partitions_blkid = parse_blkid_output(res_blkid.stdout)
 
     # Collect expected verity info from host config for the later testing usage.
     expected_verity_config = dict()
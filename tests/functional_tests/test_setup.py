@@ -1,6 +1,8 @@
 import json
 import os
 import logging
+import random
+import socket
 import subprocess
 import tempfile
 import time
@@ -29,6 +31,9 @@ users:
     sudo: ['ALL=(ALL) NOPASSWD:ALL']
 """
 
+# Upper bound for the delay between two connectivity probes in wait_online.
+WAIT_ONLINE_MAX_DELAY_SECS = 8
+
 
 def create_vm(create_params) -> Dict[str, str]:
     log.info("Creating VM with parameters: %s", create_params)
@@ -45,24 +50,41 @@ def create_vm(create_params) -> Dict[str, str]:
     return metadata["vms"][0]
 
 
+def _port_open(ip: str, port: int, timeout: float) -> bool:
+    """Checks whether a TCP connection can be established to ip:port."""
+    try:
+        with socket.create_connection((ip, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
 def wait_online(ip: str, known_hosts_path: Path, timeout: int = 60) -> None:
     """Waits for the VM to be online by checking SSH connectivity."""
-    start_time = time.time()
-    while time.time() - start_time < timeout:
-        try:
-            with open(known_hosts_path, "w") as f:
-                subprocess.run(
-                    [
-                        "ssh-keyscan",
-                        ip,
-                    ],
-                    stdout=f,
-                    check=True,
-                    timeout=5,
-                )
-            return
-        except (CalledProcessError, TimeoutExpired) as e:
-            time.sleep(5)
+    stop_time = time.monotonic() + timeout
+    # Back off exponentially with jitter so that early retries are cheap and
+    # late retries do not probe sshd at evenly-spaced intervals.
+    delay = 1.0
+    while time.monotonic() < stop_time:
+        # Only run the full SSH key exchange once sshd accepts connections.
+        if _port_open(ip, 22, 3):
+            try:
+                with open(known_hosts_path, "w") as f:
+                    subprocess.run(
+                        [
+                            "ssh-keyscan",
+                            ip,
+                        ],
+                        stdout=f,
+                        check=True,
+                        timeout=5,
+                    )
+                return
+            except (CalledProcessError, TimeoutExpired):
+                pass
+
+        time.sleep(delay + random.uniform(0, delay * 0.25))
+        delay = min(delay * 2, WAIT_ONLINE_MAX_DELAY_SECS)
 
     raise TimeoutError(f"VM with IP {ip} did not come online within {timeout} seconds.")
 